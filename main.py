@@ -1,181 +1,392 @@
-import networkx as nx
-import visualizer
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+import mcmf
+
+def _build_visual_graph(labels, layers, tails, heads, caps, costs, flows):
+    """
+    Builds the NetworkX graph (and matching flow dict) used by the visualizer.
+    Planet -> Resource arcs are drawn through a "Planet|Resource" node (layer 3).
+    networkx is only needed here, the solvers work on plain arrays.
+    """
+    import networkx as nx
+
+    nodes = [(label, {'layer': layer}) for label, layer in zip(labels, layers)]
+    edges = []
+    flow_dict = {}
+
+    for i, (t, h, c, w) in enumerate(zip(tails, heads, caps, costs)):
+        u, v = labels[t], labels[h]
+        flow = int(flows[i]) if flows is not None else 0
+
+        if layers[t] == 2:
+            # e.g., "Planet1|Iron"
+            pr_node = f"{u}|{v}"
+            # planet/resource are stored so the visualizer doesn't have to parse the name
+            nodes.append((pr_node, {'layer': 3, 'planet': u, 'resource': v}))
+            path = [(u, pr_node, w), (pr_node, v, 0)]
+        else:
+            path = [(u, v, w)]
+
+        for a, b, weight in path:
+            edges.append((a, b, {'capacity': c, 'weight': weight}))
+            if flow > 0:
+                flow_dict.setdefault(a, {})[b] = flow
 
-def solve_mission(characters, resource_targets, planet_data, current_assignments=None, switching_cost=1000000):
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    return G, flow_dict
+
+def format_orders(orders):
+    """
+    Formats work orders ({char: [(planet, item, yield, status), ...]}) as printable lines.
+    """
+    lines = {}
+    for char_id, tasks in orders.items():
+        char_lines = lines[char_id] = []
+        for p_id, item, abundance, status in tasks:
+            if item is None:
+                char_lines.append(f"{p_id:<25} {'No Collection':<20}")
+                continue
+            msg = f"{p_id:<25} {item:<20} (Yield: {abundance:<3})"
+            if status:
+                msg += f" [{status}]"
+            char_lines.append(msg)
+    return lines
+
+def _freeze(value):
+    """
+    Hashable stand-in for a character field: lists/tuples become tuples, sets become frozensets.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+def solve_mission(characters, resource_targets, planet_data, current_assignments=None, switching_cost=1000000, solver='ssp', build_graph=False):
+    """
+    Assigns characters to planets/resources. Returns (total_abundance, work_orders, G, flow_dict).
+    Work orders are (planet, item, yield, status) tuples per character; see format_orders.
+    G and flow_dict (for the visualizer) are only built with build_graph, otherwise they are None.
+    Results are cached, so re-running with identical inputs skips the solve.
+    """
     if current_assignments is None:
         current_assignments = {}
 
-    G = nx.DiGraph()
-    source, sink = "Source", "Sink"
+    # Freeze the inputs into hashable tuples (order is kept, it decides ties)
+    chars_key = tuple(
+        tuple((k, _freeze(v)) for k, v in char.items())
+        for char in characters
+    )
+    targets_key = tuple(resource_targets.items())
+    planets_key = tuple((p['id'], tuple(p['resources'].items())) for p in planet_data)
+    assignments_key = tuple(
+        (c_id, isinstance(a, dict), tuple(a.items()) if isinstance(a, dict) else tuple(a))
+        for c_id, a in current_assignments.items()
+    )
+
+    try:
+        hash((chars_key, targets_key, planets_key, assignments_key))
+    except TypeError:
+        # Some value can't be frozen (e.g. a custom field type): solve without the cache
+        return _MISSION_SOLVER.solve(
+            characters, resource_targets, planet_data, current_assignments, switching_cost, solver, build_graph
+        )
+
+    total_abundance, work_orders, G, flow_dict = _solve_mission_cached(
+        chars_key, targets_key, planets_key, assignments_key, switching_cost, solver, build_graph
+    )
+    # Hand out copies so callers can't modify the cached result (G is frozen)
+    return (
+        total_abundance,
+        {c_id: list(orders) for c_id, orders in work_orders},
+        G,
+        None if flow_dict is None else {u: dict(v) for u, v in flow_dict.items()},
+    )
+
+@lru_cache(maxsize=64)
+def _solve_mission_cached(chars_key, targets_key, planets_key, assignments_key, switching_cost, solver, build_graph):
+    characters = [dict(char) for char in chars_key]
+    resource_targets = dict(targets_key)
+    planet_data = [{'id': p_id, 'resources': dict(res)} for p_id, res in planets_key]
+    current_assignments = {
+        c_id: dict(a) if is_dict else list(a)
+        for c_id, is_dict, a in assignments_key
+    }
+
+    total_abundance, work_orders, G, flow_dict = _MISSION_SOLVER.solve(
+        characters, resource_targets, planet_data, current_assignments, switching_cost, solver, build_graph
+    )
+    if G is not None:
+        import networkx as nx
+        G = nx.freeze(G)
+    return total_abundance, tuple((c_id, tuple(orders)) for c_id, orders in work_orders.items()), G, flow_dict
+
+class MissionNetwork:
+    """
+    A built mission network: solver arrays plus what post-processing needs to read the flows back.
+    """
+    def __init__(self, labels, layers, tails, heads, caps, costs, source, sink,
+                 useful_planets, planet_res, visit_arcs, out_start, out_end):
+        self.labels, self.layers = labels, layers
+        self.tails, self.heads, self.caps, self.costs = tails, heads, caps, costs
+        self.source, self.sink = source, sink
+        self.useful_planets, self.planet_res = useful_planets, planet_res
+        self.visit_arcs = visit_arcs
+        self.out_start, self.out_end = out_start, out_end
+
+    def arrays(self):
+        # Positional arguments for the mcmf solvers
+        return len(self.labels), self.tails, self.heads, self.caps, self.costs, self.source, self.sink
+
+class MissionSolver:
+    """
+    Builds and solves the mission network.
+    Keeps the flow solver's working buffers alive between solves, so repeated
+    runs (parameter sweeps, UIs) don't reallocate them.
+    """
+    def __init__(self, max_nodes=128, max_arcs=512):
+        self.ssp = mcmf.SSPSolver(max_nodes, max_arcs)
+
+    def solve(self, characters, resource_targets, planet_data, current_assignments, switching_cost, solver='ssp', build_graph=False):
+        net = self.build(characters, resource_targets, planet_data, current_assignments, switching_cost)
+
+        # --- 2. Solve (Min Cost Max Flow) ---
+        if solver == 'ssp':
+            flows = self.ssp.solve(*net.arrays())
+        else:
+            flows = mcmf.solve(*net.arrays(), solver)
+        return self.work_orders(net, characters, current_assignments, flows, build_graph)
+
+    def solve_many(self, scenarios, switching_cost, build_graph=False):
+        """
+        Solves independent scenarios (dicts of characters, resource_targets,
+        planet_data and optional current_assignments) in one parallel SSP batch.
+        """
+        nets = [
+            self.build(sc['characters'], sc['resource_targets'], sc['planet_data'],
+                       sc.get('current_assignments') or {}, switching_cost)
+            for sc in scenarios
+        ]
+        all_flows = mcmf.solve_batch([net.arrays() for net in nets])
+        return [
+            self.work_orders(net, sc['characters'], sc.get('current_assignments') or {}, flows, build_graph)
+            for net, sc, flows in zip(nets, scenarios, all_flows)
+        ]
+
+    def build(self, characters, resource_targets, planet_data, current_assignments, switching_cost):
+        """
+        Builds the flow network for one scenario.
+        """
+        source, sink = "Source", "Sink"
+
+        # Target resources on each planet as (res, abundance) pairs.
+        # Planets without any target resource are dead ends for the solver.
+        # The C-level isdisjoint check skips irrelevant planets before any pairs are built;
+        # pairs keep the planet's resource order, since arc order decides ties.
+        target_keys = resource_targets.keys()
+        useful_planets = [p for p in planet_data if not target_keys.isdisjoint(p['resources'])]
+        planet_res = [[(r, a) for r, a in p['resources'].items() if r in target_keys] for p in useful_planets]
+
+        # Nodes are integer ids for the solver; labels/layers are kept for the visualizer.
+        node_to_idx = {}
+        labels, layers = [], []
+
+        def add_node(label, layer):
+            idx = node_to_idx.get(label)
+            if idx is None:
+                idx = node_to_idx[label] = len(labels)
+                labels.append(label)
+                layers.append(layer)
+            return idx
+
+        # Arcs are stored as parallel arrays over node ids: tail, head, capacity, cost
+        tails, heads, caps, costs = [], [], [], []
+
+        def add_edge(u, v, capacity, weight):
+            tails.append(u)
+            heads.append(v)
+            caps.append(capacity)
+            costs.append(weight)
     
-    # Layer 0: Source & Layer 5: Sink (Initial Nodes)
-    G.add_node(source, layer=0)
-    G.add_node(sink, layer=5)
+        # Layer 0: Source & Layer 5: Sink (Initial Nodes)
+        s_idx = add_node(source, 0)
+        t_idx = add_node(sink, 5)
+
+        # Layer 1 (Characters) & Layer 2 (Planets)
+        char_idx = [add_node(char['id'], 1) for char in characters]
+        planet_idx = [add_node(planet['id'], 2) for planet in useful_planets]
     
-    # --- 1. Graph Construction ---
+        # --- 1. Graph Construction ---
     
-    # Layer 1: Source -> Characters (Capacity = Max Visits)
-    for char in characters:
-        G.add_node(char['id'], layer=1)
-        G.add_edge(source, char['id'], capacity=char['max_visits'], weight=0)
+        # Layer 1: Source -> Characters (Capacity = Max Visits)
+        visit_arcs = [] # (arc index, character position, planet position)
+        for ci, (char, c_idx) in enumerate(zip(characters, char_idx)):
+            add_edge(s_idx, c_idx, capacity=char['max_visits'], weight=0)
         
-        # Get this character's current planets (if any)
-        # Structure expected: {'CharName': ['PlanetID1', 'PlanetID2']}
-        # or {'CharName': {'PlanetID1': 'Resource'}}
-        char_current_planets = current_assignments.get(char['id'], [])
+            # Banned planets, as a set for O(1) membership checks
+            banned_set = frozenset(char.get('banned', ()))
+
+            # Get this character's current planets (if any)
+            # Structure expected: {'CharName': ['PlanetID1', 'PlanetID2']}
+            # or {'CharName': {'PlanetID1': 'Resource'}}
+            # We assume the user provides IDs matching the planet list (exact match).
+            cp = current_assignments.get(char['id'], ())
+            existing_set = frozenset(cp.keys() if isinstance(cp, dict) else cp)
         
-        # Layer 2: Characters -> Planets (Capacity = 1)
-        for planet in planet_data:
-            p_id = planet['id']
-            if p_id not in G.nodes:
-                G.add_node(p_id, layer=2)
-            
-            # Skip if planet is banned for this character
-            if 'banned' in char and p_id in char['banned']:
-                continue
-            
-            # Determine cost: 0 if already set up, switching_cost if new
-            # We use a soft check to handle potential string mismatches if user drops suffixes
-            # But exact match is preferred for safety
-            edge_weight = 0
+            # Layer 2: Characters -> Planets (Capacity = 1)
+            for pi, (planet, p_idx) in enumerate(zip(useful_planets, planet_idx)):
+                p_id = planet['id']
             
-            # specific check: Is p_id in the user's list for this char?
-            # We assume the user provides IDs matching the planet list.
-            is_existing = False
-            if isinstance(char_current_planets, dict):
-                is_existing = p_id in char_current_planets
-            elif isinstance(char_current_planets, list):
-                is_existing = p_id in char_current_planets
+                # Skip if planet is banned for this character
+                if p_id in banned_set:
+                    continue
             
-            if not is_existing:
-                edge_weight = switching_cost
+                # Determine cost: 0 if already set up, switching_cost if new
+                edge_weight = 0 if p_id in existing_set else switching_cost
 
-            G.add_edge(char['id'], p_id, capacity=1, weight=edge_weight)
+                visit_arcs.append((len(tails), ci, pi))
+                add_edge(c_idx, p_idx, capacity=1, weight=edge_weight)
 
-    # Layer 3 & 4: Planets -> Planet|Resource -> Resource Type
-    for planet in planet_data:
-        p_id = planet['id']
-        
-        for res, abundance in planet['resources'].items():
-            if res in resource_targets:
-                # Node for specific resource on specific planet
-                # e.g., "Planet1|Iron"
-                pr_node = f"{p_id}|{res}"
-                G.add_node(pr_node, layer=3)
-                
-                # Planet -> Planet|Res (Cost = -Abundance)
-                # Capacity is set to len(characters) so multiple people can pick same item
-                G.add_edge(p_id, pr_node, capacity=len(characters), weight=-abundance)
-                
-                # Planet|Res -> Global Resource (Aggregation)
-                if res not in G.nodes:
-                    G.add_node(res, layer=4)
-                G.add_edge(pr_node, res, capacity=len(characters), weight=0)
-
-    # Layer 5: Global Resource -> Sink (Capacity = Target Demand)
-    for res, target in resource_targets.items():
-        # Ensure resource node exists (it might not if no planet has it)
-        if res not in G.nodes:
-             G.add_node(res, layer=4)
-        G.add_edge(res, sink, capacity=target, weight=0)
-
-    # --- 2. Solve (Min Cost Max Flow) ---
-    try:
-        flow_dict = nx.max_flow_min_cost(G, source, sink)
-    except nx.NetworkXUnfeasible:
-        print("Error: Constraints are too tight. Cannot meet resource demand.")
-        return 0, {}, G, {}
+        # Layer 3/4: Planets -> Resource Type (Cost = -Abundance)
+        # The solver needs no per-planet resource node; the visualizer still draws one.
+        # Each planet's arcs are contiguous: out_start[pi] <= e < out_end[pi]
+        # Capacity is the number of characters so multiple people can pick the same item
+        num_chars = len(characters)
+        out_start, out_end = [], []
+        for p_idx, res_list in zip(planet_idx, planet_res):
+            out_start.append(len(tails))
+            for res, abundance in res_list:
+                add_edge(p_idx, add_node(res, 4), capacity=num_chars, weight=-abundance)
+            out_end.append(len(tails))
+
+        # Layer 5: Global Resource -> Sink (Capacity = Target Demand)
+        for res, target in resource_targets.items():
+            # add_node ensures resource node exists (it might not if no planet has it)
+            add_edge(add_node(res, 4), t_idx, capacity=target, weight=0)
 
-    # --- 3. Post-Processing (Generate Work Orders) ---
+        return MissionNetwork(
+            labels, layers, tails, heads, caps, costs, s_idx, t_idx,
+            useful_planets, planet_res, visit_arcs, out_start, out_end,
+        )
+
+    def work_orders(self, net, characters, current_assignments, flows, build_graph=False):
+        """
+        Turns the solved flows into (total_abundance, work_orders, G, flow_dict).
+        G and flow_dict are None unless build_graph is set.
+        """
+        useful_planets, planet_res = net.useful_planets, net.planet_res
+        out_start, out_end = net.out_start, net.out_end
+
+        if flows is None:
+            print("Error: Constraints are too tight. Cannot meet resource demand.")
+            if not build_graph:
+                return 0, {}, None, None
+            G, _ = _build_visual_graph(net.labels, net.layers, net.tails, net.heads, net.caps, net.costs, None)
+            return 0, {}, G, {}
+
+        flows = np.asarray(flows).tolist()
+
+        # Visitors per planet, from one pass over the Character -> Planet arcs
+        # (char-major, so each planet's visitors stay in character order)
+        visitors_at = [[] for _ in useful_planets]
+        for e, ci, pi in net.visit_arcs:
+            if flows[e] > 0:
+                visitors_at[pi].append(characters[ci]['id'])
+
+        # --- 3. Post-Processing (Generate Work Orders) ---
     
-    # Initialize empty work orders
-    work_orders = {char['id']: [] for char in characters}
-    total_abundance = 0
+        # Initialize empty work orders
+        work_orders = {char['id']: [] for char in characters}
+        total_abundance = 0
 
-    for planet in planet_data:
-        p_id = planet['id']
+        for pi, planet in enumerate(useful_planets):
+            p_id = planet['id']
         
-        # A. Who is at this planet? 
-        # Check flow from all characters to this planet node
-        visitors = []
-        for char in characters:
-            c_id = char['id']
-            # Check if flow exists and is > 0
-            if c_id in flow_dict and p_id in flow_dict[c_id]:
-                if flow_dict[c_id][p_id] > 0:
-                    visitors.append(c_id)
+            # A. Who is at this planet? 
+            visitors = visitors_at[pi]
         
-        # B. What resources are being taken from this planet?
-        # Check flow from Planet to Planet|Resource nodes
-        items_to_collect = []
-        if p_id in flow_dict:
-            for neighbor, flow_amt in flow_dict[p_id].items():
-                if flow_amt > 0 and "|" in neighbor: # Identify Planet|Res nodes
-                    res_name = neighbor.split("|")[1]
+            # B. What resources are being taken from this planet?
+            # Check flow from Planet to Resource nodes (the only arcs leaving a planet,
+            # added in planet_res order)
+            items_to_collect = []
+            for e, (res_name, abundance) in zip(range(out_start[pi], out_end[pi]), planet_res[pi]):
+                flow_amt = flows[e]
+                if flow_amt > 0:
                     # If flow is 2, we add it twice: ['Iron', 'Iron']
-                    for _ in range(int(flow_amt)):
-                        items_to_collect.append(res_name)
-                        # Add to total score calculation
-                        total_abundance += planet['resources'][res_name]
+                    k = int(flow_amt)
+                    items_to_collect.extend((res_name,) * k)
+                    # Add to total score calculation
+                    total_abundance += k * abundance
 
-        # C. Assign items to visitors
-        # We attempt to match visitors to their existing resource assignments to minimize churn
+            # C. Assign items to visitors
+            # We attempt to match visitors to their existing resource assignments to minimize churn
         
-        assignments = {} # visitor -> item
-        unassigned_visitors = list(visitors)
-        unassigned_items = list(items_to_collect)
+            assignments = {} # visitor -> item
+            item_counts = Counter(items_to_collect) # item -> copies still unassigned
         
-        # 1. Greedy Match: Try to give visitors their existing resource if available
-        for visitor in list(unassigned_visitors):
-            curr_assigns = current_assignments.get(visitor, {})
-            preferred_res = None
-            if isinstance(curr_assigns, dict):
-                preferred_res = curr_assigns.get(p_id)
+            # 1. Greedy Match: Try to give visitors their existing resource if available
+            for visitor in visitors:
+                curr_assigns = current_assignments.get(visitor, {})
+                preferred_res = None
+                if isinstance(curr_assigns, dict):
+                    preferred_res = curr_assigns.get(p_id)
             
-            if preferred_res and preferred_res in unassigned_items:
-                assignments[visitor] = preferred_res
-                unassigned_visitors.remove(visitor)
-                unassigned_items.remove(preferred_res)
+                if preferred_res and item_counts[preferred_res] > 0:
+                    assignments[visitor] = preferred_res
+                    item_counts[preferred_res] -= 1
         
-        # 2. Fill remaining
-        for visitor in unassigned_visitors:
-            if unassigned_items:
-                item = unassigned_items.pop(0)
-                assignments[visitor] = item
-            else:
-                assignments[visitor] = None
-
-        # 3. Generate Orders
-        for visitor in visitors:
-            item = assignments[visitor]
-            if item:
-                abundance = planet['resources'][item]
-                
-                # Status Checks
-                curr_assigns = current_assignments.get(visitor, {})
-                has_history = bool(curr_assigns)
-                is_new_planet = p_id not in curr_assigns
+            # 2. Fill remaining (items in collection order)
+            remaining_items = item_counts.elements()
+            for visitor in visitors:
+                if visitor not in assignments:
+                    assignments[visitor] = next(remaining_items, None)
+
+            # 3. Generate Orders
+            for visitor in visitors:
+                item = assignments[visitor]
+                if item:
+                    abundance = planet['resources'][item]
                 
-                is_head_switch = False
-                if not is_new_planet and isinstance(curr_assigns, dict):
-                    if curr_assigns.get(p_id) != item:
-                        is_head_switch = True
+                    # Status Checks
+                    curr_assigns = current_assignments.get(visitor, {})
+                    has_history = bool(curr_assigns)
+                    is_new_planet = p_id not in curr_assigns
                 
-                msg = f"{p_id:<25} {item:<20} (Yield: {abundance:<3})"
+                    is_head_switch = False
+                    if not is_new_planet and isinstance(curr_assigns, dict):
+                        if curr_assigns.get(p_id) != item:
+                            is_head_switch = True
                 
-                if is_new_planet:
-                    if not has_history:
-                        msg += " [NEW PLANET]"
-                    else:
-                        msg += " [PLANET SWITCH]"
-                elif is_head_switch:
-                    msg += " [HEAD SWITCH]"
+                    status = None
+                    if is_new_planet:
+                        if not has_history:
+                            status = "NEW PLANET"
+                        else:
+                            status = "PLANET SWITCH"
+                    elif is_head_switch:
+                        status = "HEAD SWITCH"
                     
-                work_orders[visitor].append(msg)
-            else:
-                work_orders[visitor].append(f"{p_id:<25} {'No Collection':<20}")
+                    work_orders[visitor].append((p_id, item, abundance, status))
+                else:
+                    work_orders[visitor].append((p_id, None, None, None))
+
+        if not build_graph:
+            return total_abundance, work_orders, None, None
+        G, visual_flow_dict = _build_visual_graph(net.labels, net.layers, net.tails, net.heads, net.caps, net.costs, flows)
+        return total_abundance, work_orders, G, visual_flow_dict
 
-    return total_abundance, work_orders, G, flow_dict
+_MISSION_SOLVER = MissionSolver()
+
+def solve_missions(scenarios, switching_cost=1000000, build_graph=False):
+    """
+    Parameter sweep: solves many scenarios in parallel (see MissionSolver.solve_many).
+    Returns one (total_abundance, work_orders, G, flow_dict) per scenario.
+    """
+    return _MISSION_SOLVER.solve_many(scenarios, switching_cost, build_graph)
 
 # --- Example Usage ---
 
@@ -388,14 +599,16 @@ current_assignments = {
 # Set high to prioritize stability, or low to prioritize pure yield.
 SWITCHING_COST = 20 
 
-total_yield, orders, G, flow_dict = solve_mission(chars, targets, planets, current_assignments, SWITCHING_COST)
+total_yield, orders, G, flow_dict = solve_mission(chars, targets, planets, current_assignments, SWITCHING_COST, build_graph=True)
 
 # --- Visualize ---
+import visualizer
+
 visualizer.visualize_network(G, flow_dict, filename="solution_network.png")
 
 print(f"Total System Abundance: {total_yield}\n")
 print("--- MISSION ASSIGNMENTS ---")
-for char_id, tasks in orders.items():
+for char_id, tasks in format_orders(orders).items():
     print(f"\n{char_id}:")
     if not tasks:
         print("  (No tasks assigned)")
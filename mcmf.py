@@ -0,0 +1,345 @@
+"""
+Min Cost Max Flow solvers over parallel arc arrays (tails, heads, caps, costs).
+
+Every solver takes (num_nodes, tails, heads, caps, costs, source, sink) and
+returns the flow on each arc in input order, or None if it cannot solve.
+- 'ssp': successive shortest paths, JIT-compiled with Numba (default)
+- 'ortools': OR-tools' C++ solver, if installed; scales better on big networks
+- 'network_simplex': networkx fallback; requires every target to be met
+- 'highs': SciPy's HiGHS LP solver, if installed; requires every target to be met
+
+The SSP residual network is stored in forward-star form:
+- head[v]   first arc leaving node v (-1 if none)
+- next_[e]  next arc leaving the same tail as arc e
+- to[e]     head node of arc e
+- cap[e]    residual capacity of arc e
+- cost[e]   unit cost of arc e
+Every input arc i becomes the arc pair (2i, 2i + 1), so the reverse
+residual arc of e is always e ^ 1.
+"""
+import numpy as np
+from numba import njit, prange, boolean, int32, int64, void, types
+
+try:
+    from ortools.graph.python import min_cost_flow as ortools_mcf
+except ImportError:
+    ortools_mcf = None
+
+try:
+    from scipy import sparse
+    from scipy.optimize import linprog
+except ImportError:
+    linprog = None
+
+# Larger than any path cost the optimizer can produce
+INF = np.int64(2**62)
+
+@njit(void(int32[:], int32[:], int32[:], int64[:], int32[:], int32[:], int32[:], int32[:], int64[:]), cache=True)
+def build_residual(tails, heads, caps, costs, head, next_, to, cap, cost):
+    """
+    Fills the forward-star arrays (sized 2 * len(tails)) from parallel arc arrays.
+    """
+    for i in range(tails.shape[0]):
+        u, v = tails[i], heads[i]
+        e = 2 * i
+        # Forward arc
+        to[e], cap[e], cost[e] = v, caps[i], costs[i]
+        next_[e] = head[u]
+        head[u] = e
+        # Reverse residual arc (starts empty)
+        to[e + 1], cap[e + 1], cost[e + 1] = u, 0, -costs[i]
+        next_[e + 1] = head[v]
+        head[v] = e + 1
+
+@njit(void(int32[:], int32[:], int32[:], int32[:], int64[:], int64[:], boolean[:], int32[:], int32[:], int32, int32), cache=True)
+def spfa(head, next_, to, cap, cost, dist, in_q, prev_edge, queue, s, n):
+    """
+    Shortest paths from s over arcs with residual capacity (Bellman-Ford with a FIFO queue).
+    Negative costs are fine as long as the residual network has no negative cycle,
+    which successive shortest path guarantees.
+    Fills dist (INF if unreachable) and prev_edge (the arc used to reach each node).
+    queue is a ring buffer of at least n entries: in_q keeps each node in it at most once.
+    """
+    for v in range(n):
+        dist[v] = INF
+        in_q[v] = False
+        prev_edge[v] = -1
+    dist[s] = 0
+
+    queue[0] = s
+    qh, qt, q_len = 0, 1 % n, 1
+    in_q[s] = True
+    while q_len > 0:
+        u = queue[qh]
+        qh = (qh + 1) % n
+        q_len -= 1
+        in_q[u] = False
+
+        e = head[u]
+        while e != -1:
+            if cap[e] > 0:
+                v = to[e]
+                nd = dist[u] + cost[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    prev_edge[v] = e
+                    if not in_q[v]:
+                        in_q[v] = True
+                        queue[qt] = v
+                        qt = (qt + 1) % n
+                        q_len += 1
+            e = next_[e]
+
+@njit(types.UniTuple(int64, 2)(int32[:], int32[:], int32[:], int32[:], int64[:], int64[:], boolean[:], int32[:], int32[:], int32, int32, int32), cache=True)
+def min_cost_flow(head, next_, to, cap, cost, dist, in_q, prev_edge, queue, s, t, n):
+    """
+    Augments along cheapest s -> t paths until t is unreachable.
+    dist/in_q/prev_edge/queue are scratch arrays of at least n entries.
+    cap is updated in place; the flow on input arc i ends up in cap[2i + 1].
+    Returns (flow, cost).
+    """
+    total_flow = 0
+    total_cost = 0
+    while True:
+        spfa(head, next_, to, cap, cost, dist, in_q, prev_edge, queue, s, n)
+        if dist[t] == INF:
+            break
+
+        # Bottleneck capacity along the path
+        push = cap[prev_edge[t]]
+        v = t
+        while v != s:
+            e = prev_edge[v]
+            if cap[e] < push:
+                push = cap[e]
+            v = to[e ^ 1]
+
+        # Augment
+        v = t
+        while v != s:
+            e = prev_edge[v]
+            cap[e] -= push
+            cap[e ^ 1] += push
+            v = to[e ^ 1]
+
+        total_flow += push
+        total_cost += push * dist[t]
+
+    return total_flow, total_cost
+
+class SSPSolver:
+    """
+    Successive shortest path solver that keeps its working arrays between calls.
+    Buffers are sized for max_nodes/max_arcs and only grow (doubling) when a
+    larger network comes along, so repeated solves don't reallocate.
+    """
+    def __init__(self, max_nodes=128, max_arcs=512):
+        self._allocate(max_nodes, max_arcs)
+
+    def _allocate(self, max_nodes, max_arcs):
+        self.max_nodes, self.max_arcs = max_nodes, max_arcs
+
+        # Per node
+        self.head = np.empty(max_nodes, dtype=np.int32)
+        self.dist = np.empty(max_nodes, dtype=np.int64)
+        self.in_q = np.empty(max_nodes, dtype=np.bool_)
+        self.prev_edge = np.empty(max_nodes, dtype=np.int32)
+        self.queue = np.empty(max_nodes, dtype=np.int32)
+
+        # Per input arc
+        self.tails = np.empty(max_arcs, dtype=np.int32)
+        self.heads = np.empty(max_arcs, dtype=np.int32)
+        self.caps = np.empty(max_arcs, dtype=np.int32)
+        self.costs = np.empty(max_arcs, dtype=np.int64)
+
+        # Per residual arc (forward + reverse)
+        self.next_ = np.empty(2 * max_arcs, dtype=np.int32)
+        self.to = np.empty(2 * max_arcs, dtype=np.int32)
+        self.cap = np.empty(2 * max_arcs, dtype=np.int32)
+        self.cost = np.empty(2 * max_arcs, dtype=np.int64)
+
+    def reserve(self, num_nodes, num_arcs):
+        if num_nodes > self.max_nodes or num_arcs > self.max_arcs:
+            self._allocate(max(num_nodes, 2 * self.max_nodes), max(num_arcs, 2 * self.max_arcs))
+
+    def solve(self, num_nodes, tails, heads, caps, costs, source, sink):
+        m = len(tails)
+        self.reserve(num_nodes, m)
+
+        self.tails[:m] = tails
+        self.heads[:m] = heads
+        self.caps[:m] = caps
+        self.costs[:m] = costs
+
+        head = self.head[:num_nodes]
+        head.fill(-1)
+        cap = self.cap[:2 * m]
+        build_residual(
+            self.tails[:m], self.heads[:m], self.caps[:m], self.costs[:m],
+            head, self.next_[:2 * m], self.to[:2 * m], cap, self.cost[:2 * m],
+        )
+
+        min_cost_flow(
+            head, self.next_[:2 * m], self.to[:2 * m], cap, self.cost[:2 * m],
+            self.dist, self.in_q, self.prev_edge, self.queue,
+            np.int32(source), np.int32(sink), np.int32(num_nodes),
+        )
+        # Copy out, the buffer is reused by the next solve
+        return cap[1::2].copy()
+
+def solve_ssp(num_nodes, tails, heads, caps, costs, source, sink):
+    """
+    Numba successive shortest path solver (one-off buffers).
+    """
+    return SSPSolver(num_nodes, len(tails)).solve(num_nodes, tails, heads, caps, costs, source, sink)
+
+@njit(int32[:, :](int32[:], int32[:], int32[:, :], int32[:, :], int32[:, :], int64[:, :], int32[:], int32[:]), parallel=True, cache=True)
+def solve_many(num_nodes, num_arcs, tails, heads, caps, costs, sources, sinks):
+    """
+    Solves a batch of independent networks in parallel, one per row.
+    Row i uses the first num_arcs[i] columns of tails/heads/caps/costs (the rest is padding).
+    Returns the flow on every arc, padded the same way.
+    """
+    batch, width = tails.shape
+    flows = np.zeros((batch, width), dtype=np.int32)
+    for i in prange(batch):
+        n, m = num_nodes[i], num_arcs[i]
+
+        # Each instance gets its own scratch arrays
+        head = np.full(n, -1, dtype=np.int32)
+        next_ = np.empty(2 * m, dtype=np.int32)
+        to = np.empty(2 * m, dtype=np.int32)
+        cap = np.empty(2 * m, dtype=np.int32)
+        cost = np.empty(2 * m, dtype=np.int64)
+        dist = np.empty(n, dtype=np.int64)
+        in_q = np.empty(n, dtype=np.bool_)
+        prev_edge = np.empty(n, dtype=np.int32)
+        queue = np.empty(n, dtype=np.int32)
+
+        build_residual(tails[i, :m], heads[i, :m], caps[i, :m], costs[i, :m], head, next_, to, cap, cost)
+        min_cost_flow(head, next_, to, cap, cost, dist, in_q, prev_edge, queue, sources[i], sinks[i], n)
+        for j in range(m):
+            flows[i, j] = cap[2 * j + 1]
+    return flows
+
+def solve_batch(networks):
+    """
+    SSP on many networks at once, spread over all cores.
+    networks is a list of (num_nodes, tails, heads, caps, costs, source, sink);
+    returns the list of per-arc flows, in the same order.
+    """
+    num_arcs = np.array([len(net[1]) for net in networks], dtype=np.int32)
+    width = int(num_arcs.max()) if len(networks) else 0
+
+    # Pack into padded 2D arrays, one row per network
+    tails = np.zeros((len(networks), width), dtype=np.int32)
+    heads = np.zeros_like(tails)
+    caps = np.zeros_like(tails)
+    costs = np.zeros((len(networks), width), dtype=np.int64)
+    for i, (_, t, h, c, w, _, _) in enumerate(networks):
+        m = num_arcs[i]
+        tails[i, :m], heads[i, :m], caps[i, :m], costs[i, :m] = t, h, c, w
+
+    flows = solve_many(
+        np.array([net[0] for net in networks], dtype=np.int32), num_arcs,
+        tails, heads, caps, costs,
+        np.array([net[5] for net in networks], dtype=np.int32),
+        np.array([net[6] for net in networks], dtype=np.int32),
+    )
+    return [flows[i, :m] for i, m in enumerate(num_arcs)]
+
+def _sink_supply(heads, caps, sink):
+    # Total capacity into the sink, i.e. the total demand
+    return int(np.asarray(caps)[np.asarray(heads) == sink].sum())
+
+def solve_ortools(num_nodes, tails, heads, caps, costs, source, sink):
+    """
+    OR-tools' C++ min cost max flow.
+    """
+    if ortools_mcf is None:
+        raise ImportError("The 'ortools' solver requires the ortools package.")
+
+    mcf = ortools_mcf.SimpleMinCostFlow()
+    mcf.add_arcs_with_capacity_and_unit_cost(
+        np.asarray(tails, dtype=np.int32),
+        np.asarray(heads, dtype=np.int32),
+        np.asarray(caps, dtype=np.int64),
+        np.asarray(costs, dtype=np.int64),
+    )
+    # Push as much of the supply as possible from source to sink
+    supply = _sink_supply(heads, caps, sink)
+    mcf.set_node_supply(source, supply)
+    mcf.set_node_supply(sink, -supply)
+
+    if mcf.solve_max_flow_with_min_cost() != mcf.OPTIMAL:
+        return None
+    return mcf.flows(np.arange(len(tails), dtype=np.int32))
+
+def solve_network_simplex(num_nodes, tails, heads, caps, costs, source, sink):
+    """
+    networkx's network simplex.
+    Unlike max flow min cost, the full supply must reach the sink, so an
+    over-constrained network returns None instead of a partial solution.
+    """
+    # Imported here so the other solvers don't pull in networkx
+    import networkx as nx
+
+    supply = _sink_supply(heads, caps, sink)
+    G = nx.DiGraph()
+    G.add_node(source, demand=-supply)
+    G.add_node(sink, demand=supply)
+    G.add_edges_from(
+        (t, h, {'capacity': c, 'weight': w})
+        for t, h, c, w in zip(tails, heads, caps, costs)
+    )
+
+    try:
+        _, flow_dict = nx.network_simplex(G)
+    except nx.NetworkXUnfeasible:
+        return None
+    return np.array([flow_dict[t][h] for t, h in zip(tails, heads)])
+
+def solve_highs(num_nodes, tails, heads, caps, costs, source, sink):
+    """
+    Arc-flow linear program solved by SciPy's HiGHS.
+    The constraint matrix is totally unimodular, so the LP optimum is integral.
+    Like network simplex, every target must be met, otherwise returns None.
+    """
+    if linprog is None:
+        raise ImportError("The 'highs' solver requires the scipy package.")
+
+    tails = np.asarray(tails)
+    heads = np.asarray(heads)
+    caps = np.asarray(caps)
+    m = tails.shape[0]
+
+    # Flow conservation (inflow - outflow = 0) on every node but source and sink
+    arcs = np.arange(m)
+    A = sparse.csr_matrix(
+        (np.r_[np.ones(m), -np.ones(m)], (np.r_[heads, tails], np.r_[arcs, arcs])),
+        shape=(num_nodes, m),
+    )
+    keep = np.ones(num_nodes, dtype=bool)
+    keep[[source, sink]] = False
+    A_eq = A[keep]
+
+    # Arcs into the sink must run full: that is the demand
+    bounds = np.column_stack([np.where(heads == sink, caps, 0), caps])
+
+    res = linprog(np.asarray(costs), A_eq=A_eq, b_eq=np.zeros(A_eq.shape[0]), bounds=bounds, method='highs')
+    if res.status != 0:
+        return None
+    return np.rint(res.x).astype(np.int64)
+
+SOLVERS = {
+    'ssp': solve_ssp,
+    'ortools': solve_ortools,
+    'network_simplex': solve_network_simplex,
+    'highs': solve_highs,
+}
+
+def solve(num_nodes, tails, heads, caps, costs, source, sink, solver='ssp'):
+    """
+    Min cost max flow from source to sink using the named solver.
+    """
+    return SOLVERS[solver](num_nodes, tails, heads, caps, costs, source, sink)
@@ -7,12 +7,24 @@ import sys
 import os
 import shutil
 import difflib
+import collections
 import re
+from functools import partial
+from multiprocessing import Pool
+from numba import njit
+from rapidfuzz import process, fuzz
 
 # --- CONFIGURATION ---
 # Recalibrated based on verified data (User measure: 101px)
 DEFAULT_BAR_WIDTH_PX = 101
 
+# Narrowest text strip (pixels) that can still hold a resource name
+MIN_NAME_STRIP_PX = 60
+
+# Resource bars sit right of the resource names, past this X (pixels).
+# Measured on screenshots/: name text ends by x=210, bars start at x=221.
+BAR_STRIP_X = 215
+
 # STRICT ALLOWLIST
 # The script will now IGNORE any text that doesn't vaguely resemble these names.
 KNOWN_RESOURCES = [
@@ -21,42 +33,84 @@ KNOWN_RESOURCES = [
     "Ionic Solutions", "Microorganisms", "Noble Gas", "Noble Metals", 
     "Non-CS Crystals", "Planktic Colonies", "Reactive Gas", "Suspended Plasma"
 ]
+# Lowercased once, fuzzy matching is case-insensitive
+KNOWN_LOWER = [name.lower() for name in KNOWN_RESOURCES]
+
+# Candidates by their first two letters ({index: lowercased name}).
+# OCR rarely mangles the start of a name, so most lookups only score a couple of names.
+ALL_CANDIDATES = dict(enumerate(KNOWN_LOWER))
+PREFIX_IDX = collections.defaultdict(dict)
+for i, name in ALL_CANDIDATES.items():
+    PREFIX_IDX[name[:2]][i] = name
+# A prefix match this good can't be beaten by another name; anything lower checks them all
+PREFIX_SURE_SCORE = 90
+
+# Non-alphanumeric junk OCR'd in front of the planet name
+_LEADING_GARBAGE_RE = re.compile(r'^[^a-zA-Z0-9]+')
+
+# Looked up once, not per image
+_TESSERACT = shutil.which('tesseract')
+
+# Only screenshot mode needs pyautogui; keep the reason if it can't be used
+try:
+    import pyautogui
+    _PYAUTOGUI_ERROR = None
+except ImportError:
+    pyautogui = None
+    _PYAUTOGUI_ERROR = "Error: 'pyautogui' not installed."
+except KeyError:
+    pyautogui = None
+    _PYAUTOGUI_ERROR = "Error: DISPLAY environment variable not found."
+except Exception as e:
+    pyautogui = None
+    _PYAUTOGUI_ERROR = f"Error: Could not access display for screenshot. ({e})"
 
 def take_screenshot():
-    try:
-        import pyautogui
-        try:
-            screenshot = pyautogui.screenshot()
-            return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        except Exception as e:
-            print(f"Error: Could not access display for screenshot. ({e})")
-            return None
-    except ImportError:
-        print("Error: 'pyautogui' not installed.")
+    if pyautogui is None:
+        print(_PYAUTOGUI_ERROR)
         return None
-    except KeyError:
-        print("Error: DISPLAY environment variable not found.")
+    try:
+        screenshot = pyautogui.screenshot()
+        return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+    except Exception as e:
+        print(f"Error: Could not access display for screenshot. ({e})")
         return None
 
-def preprocess_for_ocr(image_roi, invert=True):
+# Scratch buffers for preprocess_for_ocr, keyed by upscaled shape
+_SCRATCH = {}
+
+def preprocess_for_ocr(image_roi, invert=True, binary_input=False):
     """
     Upscales and cleans the image for Tesseract.
+    With binary_input (already thresholded), only upscales and inverts.
     """
     h, w = image_roi.shape
+    if binary_input:
+        # Nearest keeps it binary, so there is nothing to smooth or re-threshold
+        scaled = cv2.resize(image_roi, (w * 3, h * 3), interpolation=cv2.INTER_NEAREST)
+        if invert:
+            cv2.bitwise_not(scaled, dst=scaled)
+        return scaled
+
+    shape = (h * 3, w * 3)
+    if shape not in _SCRATCH:
+        _SCRATCH[shape] = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+    scaled, blurred = _SCRATCH[shape]
     
-    # CHANGED: Use Linear interpolation + Gaussian Blur to de-pixelate.
+    # CHANGED: Use Linear interpolation + a slight blur to de-pixelate.
     # Linear is smoother than Nearest (blocky) but sharper than Cubic (blurry).
-    scaled = cv2.resize(image_roi, (w * 3, h * 3), interpolation=cv2.INTER_LINEAR)
+    cv2.resize(image_roi, (w * 3, h * 3), dst=scaled, interpolation=cv2.INTER_LINEAR)
     
-    # Denoise: Slight Gaussian Blur to smooth pixel "steps" into continuous strokes.
+    # Denoise: Slight 3x3 box blur to smooth pixel "steps" into continuous strokes.
     # This prevents Tesseract from misreading jagged pixel edges as extra characters (e.g. 3 -> 9).
-    blurred = cv2.GaussianBlur(scaled, (3, 3), 0)
+    cv2.boxFilter(scaled, -1, (3, 3), dst=blurred)
     
     # Invert (Black text on white background is best for Tesseract)
     if invert:
-        blurred = cv2.bitwise_not(blurred)
+        cv2.bitwise_not(blurred, dst=blurred)
     
     # Otsu's Binarization (Auto-find best threshold)
+    # The result is a fresh array: callers keep it while the scratch is reused.
     _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
     
     return binary
@@ -64,6 +118,13 @@ def preprocess_for_ocr(image_roi, invert=True):
 def clean_resource_name(raw_text):
     """
     Strict Fuzzy Matching. Returns None if no valid EVE resource is found.
+
+    >>> clean_resource_name("Heavy Meta1s")
+    'Heavy Metals'
+    >>> [clean_resource_name(t) for t in ("bavy Metals", "Auepusbs Liqupids", "nonic Solut0idons")]
+    ['Heavy Metals', 'Aqueous Liquids', 'Ionic Solutions']
+    >>> [clean_resource_name(t) for t in ("Build", "Scan", "Search", "Planet", "Storm", "Barren", "Extraction", "|||")]
+    [None, None, None, None, None, None, None, None]
     """
     clean = raw_text.strip()
     if len(clean) < 3: return None
@@ -71,18 +132,74 @@ def clean_resource_name(raw_text):
     # Remove common OCR garbage
     clean = clean.replace(":", "").replace(".", "").replace("|", "I").replace("!", "")
     
-    # Fuzzy Match
-    matches = difflib.get_close_matches(clean, KNOWN_RESOURCES, n=1, cutoff=0.45)
+    # Fuzzy Match: a near-exact hit among the names sharing the prefix, else the best of all.
+    # fuzz.ratio is rapidfuzz's counterpart of difflib's ratio; 46 rather than 45 since it scores a bit
+    # higher than difflib did (e.g. "Extraction" vs "Reactive Gas" is 45.5 here, 36 there).
+    query = clean.lower()
+    match = None
+    candidates = PREFIX_IDX.get(query[:2])
+    if candidates:
+        match = process.extractOne(query, candidates, scorer=fuzz.ratio, score_cutoff=PREFIX_SURE_SCORE)
+    if not match:
+        match = process.extractOne(query, ALL_CANDIDATES, scorer=fuzz.ratio, score_cutoff=46)
     
-    if matches:
-        return matches[0]
+    if match:
+        _, _, idx = match
+        return KNOWN_RESOURCES[idx]
     
     return None # REJECT garbage
 
-def process_image(img, full_bar_width, filename=None):
+@njit(cache=True)
+def _dedupe_ys(ys, dy_thresh=10):
+    """
+    Keep-mask over sorted bar Y coords: drops any bar within dy_thresh of one already kept.
+    """
+    keep = np.zeros(ys.shape[0], dtype=np.bool_)
+    last_y = -(1 << 30)
+    for i in range(ys.shape[0]):
+        # Sorted, so the last kept Y is the closest one
+        if ys[i] - last_y < dy_thresh: continue
+        last_y = ys[i]
+        keep[i] = True
+    return keep
+
+def ocr_bar_names(gray, bars):
+    """
+    Reads the resource name to the left of every bar with a single Tesseract call.
+    The text strip left of the bars is OCR'd once and each word is assigned to the
+    bar whose vertical center it spans. Returns one raw string per bar.
+    """
+    if not bars: return []
+
+    # --- Extract Resource Names ---
+    # The real bars share one left edge; the median ignores stray boxes (icons, search bar)
+    bar_x = int(np.median([x for x, _, _, _ in bars]))
+    strip_x_start = max(0, bar_x - 250)
+    strip = gray[:, strip_x_start:max(0, bar_x - 5)]
+    # Too narrow to hold a name: don't OCR a sliver
+    if strip.shape[1] < MIN_NAME_STRIP_PX: return [""] * len(bars)
+
+    processed_strip = preprocess_for_ocr(strip, invert=True)
+    scale = processed_strip.shape[0] / strip.shape[0]
+
+    # psm 6 = Uniform block of text (one line per bar)
+    data = pytesseract.image_to_data(processed_strip, config='--psm 6', output_type=pytesseract.Output.DICT)
+
+    words = [[] for _ in bars]
+    centers = [(y + bh / 2) * scale for _, y, _, bh in bars]
+    for text, left, top, height in zip(data['text'], data['left'], data['top'], data['height']):
+        if not text.strip(): continue
+        for i, cy in enumerate(centers):
+            if top <= cy <= top + height:
+                words[i].append((left, text))
+                break
+
+    return [" ".join(t for _, t in sorted(w)) for w in words]
+
+def process_image(img, full_bar_width, filename=None, save_debug=True):
     if img is None: return None
 
-    if shutil.which('tesseract') is None:
+    if _TESSERACT is None:
         print("CRITICAL ERROR: 'tesseract' is not installed.")
         sys.exit(1)
 
@@ -103,8 +220,8 @@ def process_image(img, full_bar_width, filename=None):
     _, header_pre_thresh = cv2.threshold(header_roi, 150, 255, cv2.THRESH_BINARY)
     
     # --- Upscale & Clean ---
-    # Pass the binary thresholded image to be smoothed by Linear/Blur upscaling
-    processed_header = preprocess_for_ocr(header_pre_thresh, invert=True)
+    # The header is already binary: upscale and invert only (no blur + Otsu pass)
+    processed_header = preprocess_for_ocr(header_pre_thresh, invert=True, binary_input=True)
     
     # ADDED: Padding/Border
     # Tesseract struggles with text touching the edge. Adding a 20px white border helps it see spaces.
@@ -112,7 +229,8 @@ def process_image(img, full_bar_width, filename=None):
 
     # --- DEBUG SAVE ---
     # Saves 'debug_planet_header.png' to check if '0' looks clear
-    cv2.imwrite("debug_planet_header.png", processed_header)
+    if save_debug:
+        cv2.imwrite("debug_planet_header.png", processed_header)
     
     planet_name = "Unknown"
     try:
@@ -125,7 +243,7 @@ def process_image(img, full_bar_width, filename=None):
         
         planet_name = planet_name_raw.split('\n')[0]
         planet_name = planet_name.replace("Build", "").replace("Scan", "").strip()
-        planet_name = re.sub(r'^[^a-zA-Z0-9]+', '', planet_name)
+        planet_name = _LEADING_GARBAGE_RE.sub('', planet_name)
         if "|" in planet_name: planet_name = planet_name.replace("|", "I")
         
         # --- FILENAME FALLBACK ---
@@ -148,44 +266,31 @@ def process_image(img, full_bar_width, filename=None):
         print("Error: Tesseract not found."); sys.exit(1)
 
     # --- Resource Bar Detection ---
+    # Only the strip right of the names is scanned: fewer pixels, and no
+    # false bars from the header/search bar area
+    strip_x = min(BAR_STRIP_X, gray.shape[1] - 1)
+
     # Threshold for the bars (light grey)
-    _, bar_mask = cv2.threshold(gray, 100, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(bar_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
+    _, bar_mask = cv2.threshold(gray[:, strip_x:], 100, 255, cv2.THRESH_BINARY)
+    # One [x, y, w, h, area] row per blob; row 0 is the background
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bar_mask, connectivity=8)
+    boxes = stats[1:, :4]
+    ws, hs = boxes[:, 2], boxes[:, 3]
+
+    # Stricter Geometric Filters: bars are thin, must have some length,
+    # and w/h >= 2.5 (lowered from 3 to catch shorter bars, e.g. 23%)
+    is_bar = (hs >= 4) & (hs <= 25) & (ws >= 15) & (ws * 2 >= hs * 5)
+    boxes = boxes[is_bar]
+    boxes[:, 0] += strip_x # Back to ROI coordinates
+    boxes = boxes[np.argsort(boxes[:, 1], kind='stable')] # Sort by Y
+
     resources = {}
-    bounding_boxes = [cv2.boundingRect(c) for c in contours]
-    bounding_boxes.sort(key=lambda x: x[1]) # Sort by Y
-    
-    processed_y_coords = []
 
-    for x, y, bw, bh in bounding_boxes:
-        # Stricter Geometric Filters
-        if bh < 4 or bh > 25: continue # Bars are thin
-        if bw < 15: continue # Must have some length
-        
-        # CHANGED: Lowered from 3 to 2.5 to catch shorter bars (e.g. 23%)
-        if (bw / float(bh)) < 2.5: continue 
-        
-        # De-duplicate
-        is_duplicate = False
-        for py in processed_y_coords:
-            if abs(py - y) < 10:
-                is_duplicate = True; break
-        if is_duplicate: continue
-        processed_y_coords.append(y)
-        
-        # --- Extract Resource Name ---
-        text_roi_x_end = x - 5
-        text_roi_x_start = max(0, x - 250)
-        text_roi_y_start = max(0, y - 5)
-        text_roi_y_end = min(gray.shape[0], y + bh + 5)
-        
-        text_roi = gray[text_roi_y_start:text_roi_y_end, text_roi_x_start:text_roi_x_end]
-        
-        # Process text area
-        processed_text_roi = preprocess_for_ocr(text_roi, invert=True)
-        raw_name = pytesseract.image_to_string(processed_text_roi, config='--psm 7').strip()
-        
+    # Only de-duplicated bars get OCR'd
+    bars = boxes[_dedupe_ys(boxes[:, 1])].tolist()
+    raw_names = ocr_bar_names(gray, bars)
+
+    for (x, y, bw, bh), raw_name in zip(bars, raw_names):
         # STRICT MATCHING
         final_name = clean_resource_name(raw_name)
         
@@ -193,8 +298,8 @@ def process_image(img, full_bar_width, filename=None):
             continue
             
         # --- Calculate Abundance ---
-        # Using round() to handle edges cases like 35.9 -> 36
-        abundance = int(round((bw / full_bar_width) * 100))
+        # Rounded (integer math, half up) to handle edges cases like 35.9 -> 36
+        abundance = (bw * 100 + full_bar_width // 2) // full_bar_width
         if abundance > 100: abundance = 100
         
         resources[final_name] = abundance
@@ -204,6 +309,18 @@ def process_image(img, full_bar_width, filename=None):
         "resources": resources
     }
 
+def _process_one(file_path, calibration):
+    """
+    Directory mode worker: reads and processes one image file.
+    """
+    img = cv2.imread(file_path)
+    if img is None:
+        print(f"Warning: Could not read image '{os.path.basename(file_path)}'", file=sys.stderr)
+        return None
+    # Pass file_path for filename fallback.
+    # No debug image: the workers would all race on the one debug file.
+    return process_image(img, calibration, file_path, save_debug=False)
+
 def main():
     parser = argparse.ArgumentParser(description="Extract EVE Online Planet Interaction data.")
     parser.add_argument('path', nargs='?', help="Path to screenshot file or directory.")
@@ -235,17 +352,17 @@ def main():
             print(f"No image files found in directory '{args.path}'", file=sys.stderr)
             return
 
-        for f in files:
-            file_path = os.path.join(args.path, f)
-            img = cv2.imread(file_path)
-            
-            if img is not None:
-                # Pass file_path for filename fallback
-                res = process_image(img, args.calibration, file_path)
+        # Images are independent: OCR them in parallel, one worker per core.
+        # imap returns results in file order, so the output stays deterministic.
+        file_paths = [os.path.join(args.path, f) for f in files]
+        # Check here: a worker calling sys.exit would leave the pool waiting
+        if _TESSERACT is None:
+            print("CRITICAL ERROR: 'tesseract' is not installed.")
+            sys.exit(1)
+        with Pool() as pool:
+            for res in pool.imap(partial(_process_one, calibration=args.calibration), file_paths):
                 if res:
                     results.append(res)
-            else:
-                print(f"Warning: Could not read image '{f}'", file=sys.stderr)
         
         # Output single JSON list of all planets
         print(json.dumps(results, indent=4))
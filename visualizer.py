@@ -1,40 +1,113 @@
 import networkx as nx
+import numpy as np
+from numba import njit
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+# Let Agg merge near-collinear path segments
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+# Render long paths in bigger Agg chunks
+plt.rcParams['agg.path.chunksize'] = 10000
+from matplotlib.collections import LineCollection
 import collections
+import functools
+import itertools
+import operator
 
-def get_custom_layout(G):
+# Shared empty mapping for flow lookups on nodes without outgoing flow
+_EMPTY = {}
+
+# Figure reused by visualize_network
+_FIG = None
+
+# Above this many nodes the Layer 3 layout math runs compiled; below it
+# the JIT warm-up isn't worth it
+LAYOUT_JIT_MIN_NODES = 2000
+
+# Above this many active edges, arrows are drawn as collections instead of patches
+MAX_ARROW_PATCHES = 200
+
+def _bucketize(G):
+    """
+    Groups nodes by layer and reads each Layer 3 (Planet|Res) node's planet/resource, in one pass.
+    Returns (layers, l3_pairs, l3_res): l3_pairs is a list of (planet, node),
+    l3_res maps Layer 3 nodes to their resource.
+    """
+    layers = collections.defaultdict(list)
+    l3_pairs = []
+    l3_res = {}
+    for node, data in G._node.items():
+        layer = data.get('layer', 0)
+        layers[layer].append(node)
+        if layer == 3:
+            # Node format: "PlanetID|Resource", also stored as attributes
+            planet_id, res = data.get('planet'), data.get('resource')
+            if planet_id is None or res is None:
+                planet_id, _, res = str(node).rpartition("|")
+            l3_pairs.append((planet_id, node))
+            l3_res[node] = res
+    return layers, l3_pairs, l3_res
+
+def get_custom_layout(G, buckets=None):
     """
     Calculates a custom layout:
     - Standard layers (0, 1, 4, 5) are evenly spaced centered on Y=0.
     - Layer 3 (Planet|Res) is grouped by Planet, with gaps between planets.
     - Layer 2 (Planets) is positioned to align with the center of their Layer 3 groups.
+    buckets is _bucketize(G), if the caller already has it.
+    Positions only depend on which nodes are in each layer/planet group,
+    so they are cached on that signature (re-drawing the same graph is free).
+    """
+    # Nodes by layer, and Layer 3 nodes with their planet
+    layers, l3_pairs, _ = buckets if buckets is not None else _bucketize(G)
+
+    # Layers and groups are sorted here, which is also the order they are laid out in
+    signature = (
+        tuple((layer, tuple(sorted(layers.get(layer, ())))) for layer in (0, 1, 2, 4, 5)),
+        # One sort by (planet, node) makes each planet's group a contiguous, sorted run
+        tuple(
+            (pid, tuple(node for _, node in group))
+            for pid, group in itertools.groupby(sorted(l3_pairs), key=operator.itemgetter(0))
+        ),
+    )
+    return dict(_layout_from_signature(signature))
+
+@njit(cache=True)
+def _l3_layout(group_sizes, node_spacing, planet_group_spacing):
+    """
+    Layer 3 Ys (planet groups top to bottom, with gaps) and each group's centroid.
+    """
+    ys = np.empty(group_sizes.sum(), dtype=np.float64)
+    centroids = np.empty(group_sizes.shape[0], dtype=np.float64)
+    current_y = 0.0
+    k = 0
+    for g in range(group_sizes.shape[0]):
+        first = k
+        for _ in range(group_sizes[g]):
+            ys[k] = current_y
+            current_y -= node_spacing
+            k += 1
+        centroids[g] = (ys[first] + ys[k - 1]) / 2.0
+        current_y -= planet_group_spacing
+    return ys, centroids
+
+@functools.lru_cache(maxsize=32)
+def _layout_from_signature(signature):
+    """
+    get_custom_layout's positions for a layer signature, as a tuple of (node, (x, y)).
     """
     pos = {}
+    layer_nodes, l3_groups = signature
+    layers = {layer: list(nodes) for layer, nodes in layer_nodes}
     
-    # Group nodes by layer
-    layers = collections.defaultdict(list)
-    for node, data in G.nodes(data=True):
-        layers[data.get('layer', 0)].append(node)
-        
     x_step = 3.0  # Horizontal separation between layers
     
     # --- 1. Position Layer 3 (Planet|Resource) first to establish anchor points ---
-    l3_nodes = layers[3]
-    grouped_l3 = collections.defaultdict(list)
-    for node in l3_nodes:
-        # Node format: "PlanetID|Resource"
-        parts = node.split("|")
-        planet_id = parts[0]
-        grouped_l3[planet_id].append(node)
-        
-    # Sort resources within groups
-    for pid in grouped_l3:
-        grouped_l3[pid].sort()
-        
-    # Sort planets alphabetically
-    sorted_planets = sorted(grouped_l3.keys())
+
+    # Resources within groups and planets are already sorted alphabetically
+    grouped_l3 = dict(l3_groups)
+    sorted_planets = list(grouped_l3)
     
     # Configuration for L3
     node_spacing = 1.0
@@ -44,37 +117,45 @@ def get_custom_layout(G):
     l3_y_positions = {}
     current_y = 0
     
-    # Store centroids for Layer 2 alignment
-    planet_centroids = {}
+    # Store centroids for Layer 2 alignment, as (planet, centroid) in planet order
+    pc_list = []
     
-    for pid in sorted_planets:
-        group = grouped_l3[pid]
-        group_y_start = current_y
-        
-        for node in group:
-            l3_y_positions[node] = current_y
-            current_y -= node_spacing
-        
-        # Calculate centroid for this planet
-        group_y_end = current_y + node_spacing # undo last subtract
-        centroid = (group_y_start + group_y_end) / 2.0
-        planet_centroids[pid] = centroid
-        
-        # Add gap
-        current_y -= planet_group_spacing
+    num_nodes = sum(len(nodes) for _, nodes in layer_nodes) + sum(len(g) for _, g in l3_groups)
+    if num_nodes > LAYOUT_JIT_MIN_NODES:
+        # Big graphs: same arithmetic, compiled, on group sizes
+        sizes = np.array([len(grouped_l3[pid]) for pid in sorted_planets], dtype=np.int64)
+        ys, centroids = _l3_layout(sizes, node_spacing, planet_group_spacing)
+        l3_y_positions = dict(zip(
+            (node for pid in sorted_planets for node in grouped_l3[pid]), ys.tolist()
+        ))
+        pc_list = list(zip(sorted_planets, centroids.tolist()))
+    else:
+        for pid in sorted_planets:
+            group = grouped_l3[pid]
+            
+            for node in group:
+                l3_y_positions[node] = current_y
+                current_y -= node_spacing
+            
+            # Centroid for this planet: Ys are evenly spaced, so first and last suffice
+            centroid = (l3_y_positions[group[0]] + l3_y_positions[group[-1]]) / 2.0
+            pc_list.append((pid, centroid))
+            
+            # Add gap
+            current_y -= planet_group_spacing
 
     # Center L3 around Y=0
-    min_y = min(l3_y_positions.values()) if l3_y_positions else 0
-    max_y = max(l3_y_positions.values()) if l3_y_positions else 0
+    l3_ys = np.fromiter(l3_y_positions.values(), dtype=float, count=len(l3_y_positions))
+    min_y = float(l3_ys.min()) if l3_y_positions else 0
+    max_y = float(l3_ys.max()) if l3_y_positions else 0
     mid_y = (min_y + max_y) / 2.0
     
     # Apply L3 positions
-    for node, y in l3_y_positions.items():
-        pos[node] = (3 * x_step, y - mid_y)
+    l3_ys -= mid_y
+    pos.update(zip(l3_y_positions, ((3 * x_step, y) for y in l3_ys.tolist())))
         
-    # Adjust centroids shift
-    for pid in planet_centroids:
-        planet_centroids[pid] -= mid_y
+    # Shifted centroids, built in one pass
+    planet_centroids = {pid: centroid - mid_y for pid, centroid in pc_list}
 
     # --- 2. Position Layer 2 (Planets) aligned to centroids ---
     l2_nodes = layers[2]
@@ -86,11 +167,12 @@ def get_custom_layout(G):
         pos[node] = (2 * x_step, y)
 
     # --- 3. Position Other Layers (0, 1, 4, 5) ---
+    # Spread over the height of L3 (same for every layer)
+    l3_height = (max_y - min_y) if l3_y_positions else 10
+
     for layer_idx in [0, 1, 4, 5]:
         nodes = layers[layer_idx]
-        nodes.sort()
-        
-        l3_height = (max_y - min_y) if l3_y_positions else 10
+        if not nodes: continue
         
         if len(nodes) > 1:
             step = l3_height / (len(nodes) + 1)
@@ -100,12 +182,12 @@ def get_custom_layout(G):
             current_layer_h = (len(nodes) - 1) * step
             start_y = current_layer_h / 2.0
             
-            for i, node in enumerate(nodes):
-                pos[node] = (layer_idx * x_step, start_y - (i * step))
+            ys = start_y - np.arange(len(nodes)) * step
+            pos.update(zip(nodes, ((layer_idx * x_step, y) for y in ys.tolist())))
         else:
             pos[nodes[0]] = (layer_idx * x_step, 0)
 
-    return pos
+    return tuple(pos.items())
 
 def visualize_network(G, flow_dict, filename="network_flow.png"):
     """
@@ -114,36 +196,64 @@ def visualize_network(G, flow_dict, filename="network_flow.png"):
     """
     print("Generating visualization...")
     
-    # Increase height
-    plt.figure(figsize=(24, 16))
+    # Increase height. The figure is kept between calls and only cleared,
+    # which is much cheaper than building a new one each time.
+    global _FIG
+    if _FIG is None or not plt.fignum_exists(_FIG.number):
+        _FIG = plt.figure(figsize=(24, 16))
+    else:
+        _FIG.clf()
+        plt.figure(_FIG.number) # make it current for the plt.* calls below
     
+    # Nodes by layer, shared by the layout and node drawing
+    buckets = _bucketize(G)
+    layers, _, l3_res = buckets
+
     # Use Custom Layout
     try:
-        pos = get_custom_layout(G)
+        pos = get_custom_layout(G, buckets)
     except Exception as e:
         print(f"Custom layout failed: {e}. Falling back to spring.")
         pos = nx.spring_layout(G)
 
+    # Raw networkx adjacency, read directly in the loops below
+    _node, _adj, _pred = G._node, G._adj, G._pred
+
     # --- Draw Edges ---
     active_edges = []
     inactive_edges = []
 
-    for u, v, data in G.edges(data=True):
+    for u, nbrs in _adj.items():
         # Check for flow
-        flow = 0
-        if u in flow_dict and v in flow_dict[u]:
-            flow = flow_dict[u][v]
-        
-        if flow > 0:
-            active_edges.append((u, v))
-        else:
-            inactive_edges.append((u, v))
+        u_flows = flow_dict.get(u, _EMPTY)
+        for v in nbrs:
+            (active_edges if u_flows.get(v, 0) > 0 else inactive_edges).append((u, v))
 
-    # Draw inactive edges (very faint)
-    nx.draw_networkx_edges(G, pos, edgelist=inactive_edges, edge_color='#E0E0E0', width=0.5, alpha=0.4, arrows=False)
+    # Draw inactive edges (very faint), all as one collection
+    segments = [(pos[u], pos[v]) for u, v in inactive_edges]
+    # Rasterized and kept at the back: they never need to be crisp
+    inactive_lc = LineCollection(segments, colors='#E0E0E0', linewidths=0.5, alpha=0.4)
+    inactive_lc.set_rasterized(True)
+    inactive_lc.set_zorder(0)
+    plt.gca().add_collection(inactive_lc)
     
     # Draw active edges
-    nx.draw_networkx_edges(G, pos, edgelist=active_edges, edge_color='green', width=1.5, arrows=True, arrowstyle='->', arrowsize=10)
+    if len(active_edges) > MAX_ARROW_PATCHES:
+        # One arrow patch per edge gets slow: draw the lines as one collection and
+        # the arrow heads, at each edge's midpoint, as a single quiver
+        segs = np.array([(pos[u], pos[v]) for u, v in active_edges], dtype=float)
+        plt.gca().add_collection(LineCollection(segs, colors='green', linewidths=1.5))
+        mids = segs.mean(axis=1)
+        d = segs[:, 1] - segs[:, 0]
+        norm = np.hypot(d[:, 0], d[:, 1])
+        norm[norm == 0] = 1
+        plt.quiver(
+            mids[:, 0], mids[:, 1], d[:, 0] / norm, d[:, 1] / norm,
+            angles='xy', scale_units='inches', scale=10, pivot='middle', color='green',
+            width=0.0015, headwidth=4, headlength=5, headaxislength=4.5, zorder=2,
+        )
+    else:
+        nx.draw_networkx_edges(G, pos, edgelist=active_edges, edge_color='green', width=1.5, arrows=True, arrowstyle='->', arrowsize=10)
 
     # --- Draw Nodes ---
     layer_colors = {
@@ -155,55 +265,41 @@ def visualize_network(G, flow_dict, filename="network_flow.png"):
         5: '#ff9999'  # Sink
     }
     
-    # Prepare node lists and labels
-    node_lists = collections.defaultdict(list)
+    # Prepare labels
     labels = {}
+
+    # The single Sink node (layer 5), for resource demand labels
+    sink_id = layers[5][0] if layers.get(5) else None
     
-    for node, data in G.nodes(data=True):
+    for node, data in _node.items():
         layer = data.get('layer', 0)
-        node_lists[layer].append(node)
         
         # Label Logic
         label_text = str(node)
         
         # Layer 4: Resource Node -> "Resource (Req: X)"
         if layer == 4:
-            # Find successor (Sink) to get capacity = demand
-            # Edge: Resource -> Sink
-            successors = list(G.successors(node))
+            # Capacity of the Resource -> Sink edge = demand
             demand = "?"
-            for succ in successors:
-                if G.nodes[succ].get('layer') == 5: # Sink
-                    edge_data = G.get_edge_data(node, succ)
-                    if edge_data:
-                        demand = str(edge_data.get('capacity', '?'))
-                    break
+            edge_data = _adj[node].get(sink_id)
+            if edge_data:
+                demand = str(edge_data.get('capacity', '?'))
             labels[node] = f"{label_text} (Req: {demand})"
 
         # Layer 3: Planet|Resource -> "Resource (Yield)"
         elif layer == 3:
             abundance = "?"
-            preds = list(G.predecessors(node))
-            if preds:
-                p_node = preds[0]
-                edge_data = G.get_edge_data(p_node, node)
-                if edge_data:
-                    weight = edge_data.get('weight', 0)
-                    abundance = str(abs(weight))
+            pred = _pred[node]
+            p_node = next(iter(pred), None)
+            if p_node is not None:
+                weight = pred[p_node].get('weight', 0)
+                abundance = str(abs(weight))
             
-            if "|" in label_text:
-                parts = label_text.split('|')
-                res_name = parts[1]
-                labels[node] = f"{res_name} ({abundance})"
-            else:
-                labels[node] = f"{label_text} ({abundance})"
+            labels[node] = f"{l3_res[node]} ({abundance})"
             
         # Layer 2: Planet Names -> Strip "J105433 "
         elif layer == 2:
-            if "J105433" in label_text:
-                labels[node] = label_text.replace("J105433 ", "")
-            else:
-                labels[node] = label_text
+            labels[node] = label_text.removeprefix("J105433 ")
         # Layer 1: Characters
         elif layer == 1:
              labels[node] = label_text
@@ -211,17 +307,28 @@ def visualize_network(G, flow_dict, filename="network_flow.png"):
         else:
             labels[node] = label_text
 
-    # Draw Nodes per layer
-    for layer, nodes in node_lists.items():
-        nx.draw_networkx_nodes(G, pos, nodelist=nodes, node_color=layer_colors.get(layer, 'grey'), node_size=300, alpha=1.0)
+    # Draw all nodes in one scatter, colored by layer (layers drawn in the same order as before)
+    xs, ys, colors = [], [], []
+    for layer, nodes in layers.items():
+        color = layer_colors.get(layer, 'grey')
+        for node in nodes:
+            x, y = pos[node]
+            xs.append(x)
+            ys.append(y)
+            colors.append(color)
+    plt.scatter(xs, ys, c=colors, s=300, alpha=1.0, zorder=2)
 
-    # Draw Labels
-    nx.draw_networkx_labels(G, pos, labels=labels, font_size=7, font_weight='bold')
+    # Draw Labels (plain ax.text, without draw_networkx_labels' per-node setup)
+    _text = plt.gca().text
+    for node, label in labels.items():
+        x, y = pos[node]
+        _text(x, y, label, fontsize=7, fontweight='bold', ha='center', va='center', clip_on=True)
 
     plt.title("Mission Solver Network Flow")
     plt.axis('off')
-    plt.tight_layout()
+    # Fixed margins: tight_layout would need an extra draw pass to measure artists
+    plt.subplots_adjust(left=0.02, right=0.98, top=0.96, bottom=0.02)
     
-    plt.savefig(filename)
-    plt.close()
+    # Fixed DPI and fast PNG compression (bigger file, much less encode time)
+    plt.savefig(filename, dpi=100, pil_kwargs={'optimize': False, 'compress_level': 1})
     print(f"Visualization saved to {filename}")